@@ -1,6 +1,8 @@
 import numpy as np
-from dataclasses import dataclass
+from numba import njit, prange
+from dataclasses import dataclass, field
 from typing import Union
+from functools import lru_cache
 from .games import GameConfig
 import math
 
@@ -12,30 +14,76 @@ class QAgentConfig:
     qinit: Union[np.ndarray]  # initial q-values
 
 
-def initialize_q_table(q_input, gameConfig: GameConfig, qmin=0, qmax=1):
+def initialize_q_table(q_input, gameConfig: GameConfig, qmin=0, qmax=1, dtype=None, rng=None):
+    """
+    Initializes a Q-table indexed by (agents, states, actions), stored in C order so that the actions of each agent
+    and state are contiguous in memory.
+    :param q_input: np.ndarray of q-values to broadcast or use as is, or one of "UNIFORM", "ALIGNED" and "MISALIGNED"
+    :param gameConfig: dataclass of parameters for the game
+    :param qmin: lower bound of uniformly initialized q-values
+    :param qmax: upper bound of uniformly initialized q-values
+    :param dtype: np.float32 or np.float64, where None keeps the type of a floating q_input array and is float64 else
+    :param rng: np.random.Generator for uniformly initialized q-values, a freshly seeded one if None
+    :return: np.ndarray Q-table indexed by (agents, states, actions)
+    """
+    shape = (gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions)
+    if dtype is None:
+        floating_input = type(q_input) == np.ndarray and np.issubdtype(q_input.dtype, np.floating)
+        dtype = q_input.dtype if floating_input else np.float64
+    if np.dtype(dtype) not in (np.float32, np.float64):
+        raise ValueError(f"unsupported q-table dtype {np.dtype(dtype)}, use float32 or float64")
     if type(q_input) == np.ndarray:
-        if q_input.shape == (gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions):
+        if q_input.shape == shape:
             q_table = q_input
         else:
-            q_table = q_input.T * np.ones((gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions))
+            q_table = broadcast_q_values(q_input.T, shape, dtype)
     elif q_input == "UNIFORM":
-        q_table = (qmax - qmin) * np.random.random_sample(size=(gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions)) + qmin
+        rng = np.random.default_rng() if rng is None else rng
+        q_table = (qmax - qmin) * rng.random(size=shape) + qmin
     elif q_input == "ALIGNED":
         if gameConfig.n_actions == 3:
-            q_table = np.array([[-1, -2, -2], [-2, -1, -2], [-2, -2, -1]]).T * np.ones((gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions))
+            q_table = broadcast_q_values(np.array([[-1, -2, -2], [-2, -1, -2], [-2, -2, -1]]).T, shape, dtype)
         elif gameConfig.n_actions == 2:
-            q_table = np.array([[-1, -2], [-2, -1]]).T * np.ones((gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions))
+            q_table = broadcast_q_values(np.array([[-1, -2], [-2, -1]]).T, shape, dtype)
     elif q_input == "MISALIGNED":
         if gameConfig.n_actions == 3:
-            q_table = np.array([[-2, -1, -2], [-2, -2, -1], [-1, -2, -2]]).T * np.ones((gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions))
+            q_table = broadcast_q_values(np.array([[-2, -1, -2], [-2, -2, -1], [-1, -2, -2]]).T, shape, dtype)
         elif gameConfig.n_actions == 2:
-            q_table = np.array([[-2, -1], [-1, -2]]).T * np.ones((gameConfig.n_agents, gameConfig.n_states, gameConfig.n_actions))
-    return q_table
+            q_table = broadcast_q_values(np.array([[-2, -1], [-1, -2]]).T, shape, dtype)
+    # the update and selection kernels read the actions of one agent and state as a contiguous row
+    return np.ascontiguousarray(q_table, dtype=dtype)
 
 
-def initialize_learning_rates(agentConfig: QAgentConfig, gameConfig: GameConfig):
+def broadcast_q_values(q_values, shape, dtype=np.float64):
+    """
+    Copies q-values shared by all agents into a new Q-table, allocating only the table itself.
+    :param q_values: np.ndarray of q-values broadcastable to shape, e.g. indexed by (states, actions) or (actions)
+    :param shape: tuple of (n_agents, n_states, n_actions)
+    :param dtype: floating point type of the q-values
+    :return: np.ndarray Q-table indexed by (agents, states, actions)
+    """
+    # shape is broadcast against q_values as well, so that q-values may specify more states than shape
+    shape = np.broadcast_shapes(q_values.shape, shape)
+    return np.array(np.broadcast_to(q_values, shape), dtype=dtype, order="C")
+
+
+@lru_cache(maxsize=None)
+def agent_indices(n_agents):
+    """
+    Returns the indices of all agents, which are used to gather each agent's q-values for its state. The array is
+    cached per number of agents, so that it is not reallocated on every step, and is therefore read-only.
+    :param n_agents: int
+    :return: np.ndarray indexed by (agents)
+    """
+    indices = np.arange(n_agents)
+    indices.flags.writeable = False
+    return indices
+
+
+def initialize_learning_rates(agentConfig: QAgentConfig, gameConfig: GameConfig, rng=None):
     if agentConfig.alpha == "UNIFORM":
-        agentConfig.alpha = np.random.random_sample(size=gameConfig.n_agents)
+        rng = np.random.default_rng() if rng is None else rng
+        agentConfig.alpha = rng.random(size=gameConfig.n_agents)
         return agentConfig
     elif type(agentConfig.alpha) == np.ndarray:
         return agentConfig
@@ -62,6 +110,19 @@ def update_exploration_rates(t, n_iter, exp_start=1, exp_end=0):
     return exp_end + (exp_start - exp_end) * math.exp(-1. * t / exp_decay)
 
 
+def exploration_schedule(n_iter, exp_start=1, exp_end=0):
+    """
+    Computes the exploration rates of update_exploration_rates for all iterations at once, so that a training loop
+    can index the rate of iteration t instead of recomputing it.
+    :param n_iter: int number of iterations
+    :param exp_start: float exploration rate at the first iteration
+    :param exp_end: float exploration rate approached at the last iteration
+    :return: np.ndarray exploration rates indexed by (iterations)
+    """
+    exp_decay = n_iter / 8
+    return exp_end + (exp_start - exp_end) * np.exp(-1. * np.arange(n_iter) / exp_decay)
+
+
 def bellman_update_q_table(Q, S, A, R, S_, agentConfig: QAgentConfig):
     """
     Performs a one-step update using the bellman update equation for Q-learning.
@@ -73,15 +134,37 @@ def bellman_update_q_table(Q, S, A, R, S_, agentConfig: QAgentConfig):
     :param S_: np.ndarray Next States indexed by (agents)
     :return: np.ndarray Q-table indexed by (agents, states, actions)
     """
-    ind = np.arange(len(S))
-    all_belief_updates = agentConfig.alpha * (R + agentConfig.gamma * Q[ind, S_].max(axis=1) - Q[ind, S, A])
-    Q[ind, S, A] = Q[ind, S, A] + all_belief_updates
-    return Q, np.abs(all_belief_updates).sum()
+    n_agents = len(S)
+    alpha = np.broadcast_to(np.asarray(agentConfig.alpha, dtype=np.float64), n_agents)
+    gamma = np.broadcast_to(np.asarray(agentConfig.gamma, dtype=np.float64), n_agents)
+    sum_of_belief_updates = _bellman_update_kernel(Q, S, A, R, S_, alpha, gamma)
+    return Q, sum_of_belief_updates
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _bellman_update_kernel(Q, S, A, R, S_, alpha, gamma):
+    """
+    Updates Q in place in a single pass over agents, fusing the max over next actions, the update and the sum of
+    absolute belief updates.
+    """
+    total = 0.0
+    for i in prange(S.shape[0]):
+        next_max = Q[i, S_[i], 0]
+        for a in range(1, Q.shape[2]):
+            if Q[i, S_[i], a] > next_max:
+                next_max = Q[i, S_[i], a]
+        belief_update = alpha[i] * (R[i] + gamma[i] * next_max - Q[i, S[i], A[i]])
+        Q[i, S[i], A[i]] += belief_update
+        total += abs(belief_update)
+    return total
 
 
 @dataclass
 class EpsilonGreedyConfig(QAgentConfig):
     epsilon: Union[float, str]
+    # source of all random draws of the policy. Pickled or copied configs continue the same random stream, so each
+    # replicate needs its own rng, e.g. np.random.default_rng(s) for each s in np.random.SeedSequence(seed).spawn(n)
+    rng: np.random.Generator = field(default_factory=np.random.default_rng)
 
 
 def e_greedy_select_action(Q, S, agentConfig: EpsilonGreedyConfig):
@@ -94,15 +177,31 @@ def e_greedy_select_action(Q, S, agentConfig: EpsilonGreedyConfig):
     :param S: np.ndarray States indexed by (agents)
     :return: np.ndarray Actions indexed by (agents)
     """
-    indices = np.arange(len(S))
-    rand = np.random.random_sample(size=len(S))
-    randA = np.random.randint(len(Q[0, 0, :]), size=len(S))
-    A = np.where(rand >= agentConfig.epsilon,
-                 np.argmax(Q[indices, S, :], axis=1),
-                 randA)
+    rand = agentConfig.rng.random(size=len(S))
+    randA = agentConfig.rng.integers(len(Q[0, 0, :]), size=len(S))
+    epsilon = np.broadcast_to(np.asarray(agentConfig.epsilon, dtype=np.float64), len(S))
+    A = np.empty(len(S), dtype=np.int64)
+    _e_greedy_kernel(Q, S, epsilon, rand, randA, A)
     return A
 
 
+@njit(parallel=True, cache=True)
+def _e_greedy_kernel(Q, S, epsilon, rand, randA, A):
+    """
+    Fills A in place with the random action of exploring agents, and the first argmax action of all other agents.
+    The argmax is only computed for agents that do not explore.
+    """
+    for i in prange(S.shape[0]):
+        if rand[i] < epsilon[i]:
+            A[i] = randA[i]
+        else:
+            best = 0
+            for a in range(1, Q.shape[2]):
+                if Q[i, S[i], a] > Q[i, S[i], best]:
+                    best = a
+            A[i] = best
+
+
 def e_greedy_select_action_randomized_argmax(Q, S, agentConfig: EpsilonGreedyConfig):
     """
     Select actions based on an epsilon greedy policy. Epsilon determines the probability with which
@@ -115,22 +214,38 @@ def e_greedy_select_action_randomized_argmax(Q, S, agentConfig: EpsilonGreedyCon
     :return: np.ndarray Actions indexed by (agents)
     """
     n_agents = len(S)
-    indices = np.arange(n_agents)
-    rand = np.random.random_sample(size=n_agents)
+    indices = agent_indices(n_agents)
+    rand = agentConfig.rng.random(size=n_agents)
 
-    randA = np.random.randint(len(Q[0, 0, :]), size=n_agents)
+    randA = agentConfig.rng.integers(len(Q[0, 0, :]), size=n_agents)
 
-    rng = np.random.default_rng()
-    argmax_actions = rng.choice(np.where(
-        [np.isclose(vals.max(axis=0), vals) for vals in Q[indices, S, :]]
-    ))
+    # drawing uniform noise only on the maximal entries and taking its argmax breaks ties uniformly at random
+    values = Q[indices, S, :]
+    is_max = np.isclose(values.max(axis=1, keepdims=True), values)
+    argmax_actions = (agentConfig.rng.random(size=values.shape) * is_max).argmax(axis=1)
     A = np.where(rand >= agentConfig.epsilon, argmax_actions, randA)
     return A
 
 
+def stable_exponentials(values, temperature):
+    """
+    Exponentiates values scaled by a temperature after shifting each row by its maximum. The shift cancels in any
+    softmax ratio, but keeps all exponentials in (0, 1] so that they can neither overflow nor all underflow.
+    :param values: np.ndarray of values indexed by (agents, actions)
+    :param temperature: float
+    :return: np.ndarray of exponentials indexed by (agents, actions)
+    """
+    scaled = values / temperature
+    scaled -= scaled.max(axis=1, keepdims=True)
+    return np.exp(scaled)
+
+
 @dataclass
 class BoltzmannAgentConfig(QAgentConfig):
     temperature: Union[float, str]
+    # source of all random draws of the policy. Pickled or copied configs continue the same random stream, so each
+    # replicate needs its own rng, e.g. np.random.default_rng(s) for each s in np.random.SeedSequence(seed).spawn(n)
+    rng: np.random.Generator = field(default_factory=np.random.default_rng)
 
 
 def boltzmann_select_action(Q, S, agentConfig: BoltzmannAgentConfig):
@@ -138,23 +253,18 @@ def boltzmann_select_action(Q, S, agentConfig: BoltzmannAgentConfig):
     Selects actions by drawing from a distribution determined by a softmax operator on the q-values.
     The temperature parameter approaching 0 leads to a distribution which approaches an argmax, while
     approaching infinity leads to the uniform random distribution.
-    WARNING: low temperature values can easily lead to NaNs or infs.
+    The q-values are shifted by their maximum before exponentiation, so low temperatures do not overflow.
     :param agentConfig:
     :param Q: np.ndarray Q-table indexed by (agents, states, actions)
     :param S: np.ndarray States indexed by (agents)
     :return: np.ndarray Actions indexed by (agents)
     """
-    indices = np.arange(len(S)).astype(int)
-    rng = np.random.default_rng()
-    values_exponential = np.exp(Q[indices, S] / agentConfig.temperature)
-    denominator = np.sum(values_exponential, axis=1)
-    probabilities = np.divide(values_exponential.T, denominator).T
-    actions = np.array(
-        [rng.choice(
-            a=Q.shape[-1],  # n_actions
-            p=probabilities[i]
-        ) for i in range(Q.shape[0])]  # n_agents
-    )
+    indices = agent_indices(len(S))
+    values_exponential = stable_exponentials(Q[indices, S], agentConfig.temperature)
+    # inverse-CDF sampling on the unnormalized cumulative sums, one uniform draw per agent
+    cumulative = values_exponential.cumsum(axis=1)
+    u = agentConfig.rng.random(len(S)) * cumulative[:, -1]
+    actions = (cumulative > u[:, None]).argmax(axis=1)
     return actions
 
 
@@ -167,8 +277,8 @@ def follow_the_regularized_leader_select_action(Q, S, agentConfig: BoltzmannAgen
     :param S: np.ndarray States indexed by (agents)
     :return: np.ndarray Actions indexed by (agents)
     """
-    indices = np.arange(len(S))
-    values_exponential = np.exp(Q[indices, S] / agentConfig.temperature)
+    indices = agent_indices(len(S))
+    values_exponential = stable_exponentials(Q[indices, S], agentConfig.temperature)
     denominator = np.sum(values_exponential, axis=1)
     regularization = np.divide(values_exponential.T, denominator).T
     x = Q[indices, S] - regularization
@@ -178,13 +288,20 @@ def follow_the_regularized_leader_select_action(Q, S, agentConfig: BoltzmannAgen
 
 def average_rolled_q_tables(Q, neighborhood):
     """
-    Creates an array where successive rows are "rolled" versions of Q, along the axis of agents.
-    This is created and used for experiments where agents average their q-values with each others for
+    Averages each agent's q-values with those of the preceding agents, wrapping around along the axis of agents. This
+    equals the mean over "rolled" versions of Q, but is computed from cumulative sums without materializing the rolls.
+    This is used for experiments where agents average their q-values with each others for
     different sizes of neighborhoods.
     :param Q: np.ndarray Q-table indexed by (agents, states, actions)
     :param neighborhood:
     :return: np.ndarray Q-table with averaged entries indexed by (agents, states, actions)
     """
-    tmp_Q = np.array([np.roll(Q, shift=i, axis=0) for i in range(neighborhood)])
-    Q = np.mean(tmp_Q, axis=0)
-    return Q
+    n_agents = Q.shape[0]
+    # agent j averages over agents j - neighborhood + 1, ..., j (wrapping around), as a difference of cumulative sums.
+    # The sums are accumulated in double precision over the deviations from the mean over agents, so that they stay
+    # small and their differences do not lose precision as the number of agents grows.
+    anchor = Q.mean(axis=0, dtype=np.float64)
+    padded = Q[np.arange(1 - neighborhood, n_agents) % n_agents] - anchor
+    cumulative = np.concatenate([np.zeros_like(padded[:1]), padded.cumsum(axis=0)], axis=0)
+    averaged = (cumulative[neighborhood:] - cumulative[:-neighborhood]) / neighborhood + anchor
+    return averaged.astype(np.result_type(Q.dtype, np.float32), copy=False)
@@ -1,4 +1,5 @@
 import numpy as np
+from numba import njit
 from dataclasses import dataclass
 
 
@@ -27,21 +28,38 @@ def braess_augmented_network(actions, config: RouteConfig):
     :param config: dataclass of parameters for the game
     :return:
     """
-    n_agents = config.n_agents
-    n_up = (actions == 0).sum()
-    n_down = (actions == 1).sum()
-    n_cross = (actions == 2).sum()
-
-    r_0 = 1 + (n_up + n_cross) / n_agents
-    r_1 = 1 + (n_down + n_cross) / n_agents
-    r_2 = (n_up + n_cross) / n_agents + (n_down + n_cross) / n_agents + config.cost
-
-    T = np.array([-r_0, -r_1, -r_2])
-    R = T[actions]
+    R = np.empty(len(actions))
+    T = np.empty(3)
+    braess_augmented_network_kernel(actions, R, T, (config.n_agents, float(config.cost)))
     S = None
     return R, S
 
 
+@njit(cache=True)
+def braess_augmented_network_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the travel times T of braess_augmented_network in place.
+    :param params: tuple of (n_agents, cost)
+    """
+    n_agents, cost = params
+    n_up = 0
+    n_down = 0
+    n_cross = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+        elif a == 1:
+            n_down += 1
+        else:
+            n_cross += 1
+
+    T[0] = -(1 + (n_up + n_cross) / n_agents)
+    T[1] = -(1 + (n_down + n_cross) / n_agents)
+    T[2] = -((n_up + n_cross) / n_agents + (n_down + n_cross) / n_agents + cost)
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
+
+
 def braess_initial_network(actions, config: RouteConfig):
     """
     Network from the Braess Paradox without the added link, and the Nash Equilibrium average travel time is 1.5,
@@ -50,16 +68,30 @@ def braess_initial_network(actions, config: RouteConfig):
     :param config: dataclass of parameters for the game
     :return:
     """
-    n_agents = config.n_actions
-    n_up = (actions == 0).sum()
-    n_down = (actions == 1).sum()
+    R = np.empty(len(actions))
+    T = np.empty(2)
+    braess_initial_network_kernel(actions, R, T, (config.n_actions,))
+    return R, T
 
-    r_0 = 1 + n_up / n_agents
-    r_1 = 1 + n_down / n_agents
 
-    T = np.array([-r_0, -r_1])
-    R = T[actions]
-    return R, T
+@njit(cache=True)
+def braess_initial_network_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the travel times T of braess_initial_network in place.
+    :param params: tuple of (normalizer,), the number by which path counts are divided, for which
+    braess_initial_network passes config.n_actions
+    """
+    normalizer = params[0]
+    n_up = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+    n_down = actions.shape[0] - n_up
+
+    T[0] = -(1 + n_up / normalizer)
+    T[1] = -(1 + n_down / normalizer)
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
 
 
 def two_route_game(actions, config: RouteConfig):
@@ -71,15 +103,28 @@ def two_route_game(actions, config: RouteConfig):
     :param cost:
     :return:
     """
-    n_agents = config.n_agents
-    n_up = (actions == 0).sum()
+    R = np.empty(len(actions))
+    T = np.empty(2)
+    two_route_game_kernel(actions, R, T, (config.n_agents, float(config.cost)))
+    return R, T
 
-    r_0 = n_up / n_agents + config.cost
-    r_1 = (1 - n_up / n_agents) + (1 - config.cost)
 
-    T = np.array([-r_0, -r_1])
-    R = T[actions]
-    return R, T
+@njit(cache=True)
+def two_route_game_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the travel times T of two_route_game in place.
+    :param params: tuple of (n_agents, cost)
+    """
+    n_agents, cost = params
+    n_up = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+
+    T[0] = -(n_up / n_agents + cost)
+    T[1] = -((1 - n_up / n_agents) + (1 - cost))
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
 
 
 def pigou(actions, config):
@@ -90,16 +135,28 @@ def pigou(actions, config):
     :param cost:
     :return:
     """
-    n_agents = config.n_agents
-    n_down = (actions == 1).sum()
-    pct = n_down / n_agents
+    R = np.empty(len(actions))
+    T = np.empty(2)
+    pigou_kernel(actions, R, T, (config.n_agents, float(config.cost)))
+    return R, T
 
-    r_0 = config.cost
-    r_1 = pct
 
-    T = np.array([-r_0, -r_1])
-    R = T[actions]
-    return R, T
+@njit(cache=True)
+def pigou_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the travel times T of pigou in place.
+    :param params: tuple of (n_agents, cost)
+    """
+    n_agents, cost = params
+    n_down = 0
+    for a in actions:
+        if a == 1:
+            n_down += 1
+
+    T[0] = -cost
+    T[1] = -(n_down / n_agents)
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
 
 
 def pigou3(actions, config: GameConfig):
@@ -109,18 +166,82 @@ def pigou3(actions, config: GameConfig):
     :param config: dataclass of parameters for the game
     :return:
     """
-    n_agents = config.n_agents
-    n_up = (actions == 0).sum()
+    R = np.empty(len(actions))
+    T = np.empty(3)
+    pigou3_kernel(actions, R, T, (config.n_agents,))
+    return R, T
 
-    r_0 = n_up / n_agents
-    r_1 = 1
-    r_2 = 1
 
-    T = np.array([-r_0, -r_1, -r_2])
-    R = T[actions]
+@njit(cache=True)
+def pigou3_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the travel times T of pigou3 in place.
+    :param params: tuple of (n_agents,)
+    """
+    n_agents = params[0]
+    n_up = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+
+    T[0] = -(n_up / n_agents)
+    T[1] = -1.
+    T[2] = -1.
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
+
+
+def build_two_route_LUT(config: RouteConfig):
+    """
+    Precomputes the travel times of two_route_game for every possible number of players on the first route.
+    :param config: dataclass of parameters for the game
+    :return: np.ndarray of travel times indexed by (number of players taking action 0, actions)
+    """
+    pct_up = np.arange(config.n_agents + 1) / config.n_agents
+    return -np.stack([pct_up + config.cost, (1 - pct_up) + (1 - config.cost)], axis=1)
+
+
+def build_pigou_LUT(config: RouteConfig):
+    """
+    Precomputes the travel times of pigou for every possible number of players on the fixed cost path.
+    :param config: dataclass of parameters for the game
+    :return: np.ndarray of travel times indexed by (number of players taking action 0, actions)
+    """
+    pct_down = (config.n_agents - np.arange(config.n_agents + 1)) / config.n_agents
+    return -np.stack([np.full(config.n_agents + 1, float(config.cost)), pct_down], axis=1)
+
+
+def lookup_table_game(actions, T_table):
+    """
+    Plays a game whose payoffs only depend on the number of players taking action 0, by looking up the payoffs in a
+    table precomputed with, e.g., build_two_route_LUT or build_pigou_LUT.
+    :param actions: np.ndarray of Actions indexed by agents
+    :param T_table: np.ndarray of payoffs indexed by (number of players taking action 0, actions)
+    :return:
+    """
+    R = np.empty(len(actions))
+    T = np.empty(T_table.shape[1])
+    lookup_table_game_kernel(actions, R, T, (T_table,))
     return R, T
 
 
+@njit(cache=True)
+def lookup_table_game_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the payoffs T of lookup_table_game in place.
+    :param params: tuple of (T_table,)
+    """
+    T_table = params[0]
+    n_up = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+
+    T[:] = T_table[n_up]
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
+
+
 @dataclass
 class MinorityConfig(GameConfig):
     threshold: float
@@ -133,19 +254,29 @@ def minority_game(actions, config: MinorityConfig):
     :param config: dataclass of parameters for the game
     :return:
     """
-    n_agents = config.n_agents
-    n_up = (actions == 0).sum()
+    R = np.empty(len(actions))
+    T = np.empty(2)
+    minority_game_kernel(actions, R, T, (config.n_agents, float(config.threshold)))
+    return R, T
 
-    if n_agents * config.threshold >= n_up:  # up is minority
-        r_0 = 1
-        r_1 = 0
-    else:
-        r_0 = 0
-        r_1 = 1
 
-    T = np.array([r_0, r_1])
-    R = T[actions]
-    return R, T
+@njit(cache=True)
+def minority_game_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the payoffs T of minority_game in place.
+    :param params: tuple of (n_agents, threshold)
+    """
+    n_agents, threshold = params
+    n_up = 0
+    for a in actions:
+        if a == 0:
+            n_up += 1
+
+    is_minority = n_agents * threshold >= n_up  # up is minority
+    T[0] = 1. if is_minority else 0.
+    T[1] = 1. - T[0]
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
 
 
 def minority_game_2(actions, config: GameConfig):
@@ -156,7 +287,7 @@ def minority_game_2(actions, config: GameConfig):
     :return:
     """
     n_agents = config.n_agents
-    n_a = (actions == 0).sum()
+    n_a = np.bincount(actions, minlength=2)[0]
     fraction_a = n_a / n_agents
     fraction_b = 1 - fraction_a
 
@@ -177,16 +308,30 @@ def el_farol_bar(actions, config: MinorityConfig):
     :param actions: np.ndarray of Actions indexed by agents
     :return:
     """
-    n_agents = len(actions)
-    n_bar = (actions == 1).sum()
-    pct = n_bar / n_agents
+    R = np.empty(len(actions))
+    T = np.empty(2)
+    el_farol_bar_kernel(actions, R, T, (float(config.threshold),))
+    return R, T
 
-    r_0 = 1
-    r_1 = 2 - 4 * pct if (pct > config.threshold) else 4 * pct - 2
 
-    T = np.array([-r_0, -r_1])
-    R = T[actions]
-    return R, T
+@njit(cache=True)
+def el_farol_bar_kernel(actions, R, T, params):
+    """
+    Fills the rewards R and the payoffs T of el_farol_bar in place.
+    :param params: tuple of (threshold,)
+    """
+    threshold = params[0]
+    n_bar = 0
+    for a in actions:
+        if a == 1:
+            n_bar += 1
+    pct = n_bar / actions.shape[0]
+
+    is_crowded = 1. if pct > threshold else 0.
+    T[0] = -1.
+    T[1] = -((2 - 4 * pct) * is_crowded + (4 * pct - 2) * (1 - is_crowded))
+    for i in range(actions.shape[0]):
+        R[i] = T[actions[i]]
 
 
 def duopoly(actions, config: GameConfig):
@@ -273,14 +418,13 @@ def population_game(actions, config: PopulationConfig):
     :return:
     """
     n_players = len(actions)
-    fraction_weak = (actions == 0).sum() / n_players
-    fraction_strong = (actions == 1).sum() / n_players
+    fraction_weak, fraction_strong = np.bincount(actions, minlength=2) / n_players
 
     utility_weak = config.V * (fraction_weak * config.K) ** (config.exponent - 1) - config.cost
     utility_strong = config.V * (fraction_strong * config.K) ** (config.exponent - 1)  # no added cost
 
     T = [utility_weak, utility_strong]
-    R = np.array([T[a] for a in actions])
+    R = np.array(T)[actions]
     return R, T
 
 
@@ -299,6 +443,26 @@ def public_goods_game(actions, config: PublicGoodsConfig):
     :return:
     """
     norm_A = actions / config.n_actions
-    pot = config.multiplier * np.power(norm_A, config.beta).sum()
+    pot = config.multiplier * power_sum(norm_A, config.beta)
     R = 1 - norm_A + pot
     return R
+
+
+def power_sum(x, exponent):
+    """
+    Computes the sum of x to the power of exponent, using sums and products instead of np.power for the positive
+    integer exponents that are commonly used.
+    :param x: np.ndarray
+    :param exponent: float
+    :return: float
+    """
+    if exponent == 1:
+        return x.sum()
+    elif exponent == 2:
+        return np.dot(x, x)
+    elif exponent > 2 and float(exponent).is_integer():
+        powered = x * x
+        for _ in range(int(exponent) - 2):
+            powered *= x
+        return powered.sum()
+    return np.power(x, exponent).sum()
@@ -0,0 +1,160 @@
+"""
+JAX versions of the q-learning updates, policies and a selection of games, together with a training loop which is
+compiled as a whole with jax.lax.scan. This module requires jax, which is an optional dependency, and is therefore
+not imported by the package itself: import it as `learning_in_games.jax_learning`.
+"""
+import dataclasses
+from functools import partial
+import jax
+import jax.numpy as jnp
+from .games import GameConfig, RouteConfig, PublicGoodsConfig
+
+
+def bellman_update_q_table(Q, S, A, R, S_, alpha, gamma):
+    """
+    Performs a one-step update using the bellman update equation for Q-learning.
+    :param Q: jnp.ndarray Q-table indexed by (agents, states, actions)
+    :param S: jnp.ndarray States indexed by (agents)
+    :param A: jnp.ndarray Actions indexed by (agents)
+    :param R: jnp.ndarray Rewards indexed by (agents)
+    :param S_: jnp.ndarray Next States indexed by (agents)
+    :param alpha: float or jnp.ndarray learning rates indexed by (agents)
+    :param gamma: float or jnp.ndarray discount factors indexed by (agents)
+    :return: jnp.ndarray Q-table indexed by (agents, states, actions), and the sum of absolute belief updates
+    """
+    ind = jnp.arange(S.shape[0])
+    all_belief_updates = alpha * (R + gamma * Q[ind, S_].max(axis=1) - Q[ind, S, A])
+    Q = Q.at[ind, S, A].add(all_belief_updates)
+    return Q, jnp.abs(all_belief_updates).sum()
+
+
+def e_greedy_select_action(key, Q, S, epsilon):
+    """
+    Select actions based on an epsilon greedy policy. Epsilon determines the probability with which
+    an action is selected at random. Otherwise, the action is selected as the argmax of the state.
+    :param key: jax.random.PRNGKey
+    :param Q: jnp.ndarray Q-table indexed by (agents, states, actions)
+    :param S: jnp.ndarray States indexed by (agents)
+    :param epsilon: float exploration rate
+    :return: jnp.ndarray Actions indexed by (agents)
+    """
+    key_rand, key_randA = jax.random.split(key)
+    n_agents = S.shape[0]
+    rand = jax.random.uniform(key_rand, shape=(n_agents,))
+    randA = jax.random.randint(key_randA, shape=(n_agents,), minval=0, maxval=Q.shape[2])
+    return jnp.where(rand >= epsilon, jnp.argmax(Q[jnp.arange(n_agents), S, :], axis=1), randA)
+
+
+def boltzmann_select_action(key, Q, S, temperature):
+    """
+    Selects actions by drawing from a distribution determined by a softmax operator on the q-values.
+    :param key: jax.random.PRNGKey
+    :param Q: jnp.ndarray Q-table indexed by (agents, states, actions)
+    :param S: jnp.ndarray States indexed by (agents)
+    :param temperature: float
+    :return: jnp.ndarray Actions indexed by (agents)
+    """
+    return jax.random.categorical(key, Q[jnp.arange(S.shape[0]), S] / temperature, axis=1)
+
+
+def braess_augmented_network(actions, config: RouteConfig):
+    """
+    Network from the Braess Paradox with the added link, see `games.braess_augmented_network`.
+    :param actions: jnp.ndarray of Actions indexed by agents
+    :param config: dataclass of parameters for the game
+    :return: jnp.ndarray rewards indexed by agents, and jnp.ndarray travel times indexed by actions
+    """
+    n_up, n_down, n_cross = jnp.bincount(actions, length=3)
+
+    r_0 = 1 + (n_up + n_cross) / config.n_agents
+    r_1 = 1 + (n_down + n_cross) / config.n_agents
+    r_2 = (n_up + n_cross) / config.n_agents + (n_down + n_cross) / config.n_agents + config.cost
+
+    T = -jnp.stack([r_0, r_1, r_2])
+    return T[actions], T
+
+
+def two_route_game(actions, config: RouteConfig):
+    """
+    A two path routing game, see `games.two_route_game`.
+    :param actions: jnp.ndarray of Actions indexed by agents
+    :param config: dataclass of parameters for the game
+    :return: jnp.ndarray rewards indexed by agents, and jnp.ndarray travel times indexed by actions
+    """
+    n_up = (actions == 0).sum()
+
+    r_0 = n_up / config.n_agents + config.cost
+    r_1 = (1 - n_up / config.n_agents) + (1 - config.cost)
+
+    T = -jnp.stack([r_0, r_1])
+    return T[actions], T
+
+
+def public_goods_game(actions, config: PublicGoodsConfig):
+    """
+    A public goods game, see `games.public_goods_game`.
+    :param actions: jnp.ndarray of Actions indexed by agents
+    :param config: dataclass of parameters for the game
+    :return: jnp.ndarray rewards indexed by agents, and None as the game has no per-action payoffs
+    """
+    norm_A = actions / config.n_actions
+    pot = config.multiplier * jnp.power(norm_A, config.beta).sum()
+    return 1 - norm_A + pot, None
+
+
+def run_q_learning(Q, S, key, gameConfig: GameConfig, payoff, select_action, policy_schedule, alpha, gamma):
+    """
+    Runs gameConfig.n_iter steps of stateless q-learning as a single compiled jax.lax.scan. Each step selects actions,
+    plays the game and updates the q-table, without returning to Python in between. The scan is compiled once per
+    combination of game parameters, game, policy and array shapes, and reused by later calls.
+    The q-table is converted to jax's default floating point type, which is float32 unless jax_enable_x64 is set,
+    so that results differ from the float64 NumPy functions by float32 rounding by default.
+    :param Q: np.ndarray Q-table indexed by (agents, states, actions)
+    :param S: np.ndarray States indexed by (agents), which stay fixed during the run
+    :param key: jax.random.PRNGKey
+    :param gameConfig: dataclass of parameters for the game
+    :param payoff: a game from this module, called as payoff(actions, gameConfig)
+    :param select_action: a policy from this module, called as select_action(key, Q, S, policy_parameter)
+    :param policy_schedule: np.ndarray of policy parameters (epsilon or temperature) indexed by (iterations)
+    :param alpha: float or np.ndarray learning rates indexed by (agents)
+    :param gamma: float or np.ndarray discount factors indexed by (agents)
+    :return: jnp.ndarray final Q-table, and a dict of metrics indexed by (iterations, ...)
+    """
+    keys = jax.random.split(key, gameConfig.n_iter)
+    Q = jnp.asarray(Q, dtype=jnp.result_type(float))
+    return _simulate(Q, jnp.asarray(S), keys, jnp.asarray(policy_schedule), jnp.asarray(alpha), jnp.asarray(gamma),
+                     _StaticConfig(gameConfig), payoff, select_action)
+
+
+class _StaticConfig:
+    """
+    Wraps a game config, whose dataclass is unhashable, so that it can be a static argument of a jitted function.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.key = (type(config), dataclasses.astuple(config))
+
+    def __hash__(self):
+        return hash(self.key)
+
+    def __eq__(self, other):
+        return isinstance(other, _StaticConfig) and self.key == other.key
+
+
+@partial(jax.jit, static_argnames=("static_config", "payoff", "select_action"))
+def _simulate(Q, S, keys, policy_schedule, alpha, gamma, static_config, payoff, select_action):
+    gameConfig = static_config.config
+
+    def step(carry, inputs):
+        Q, S = carry
+        step_key, policy_parameter = inputs
+        A = select_action(step_key, Q, S, policy_parameter)
+        R, _ = payoff(A, gameConfig)
+        Q, sum_of_belief_updates = bellman_update_q_table(Q, S, A, R, S, alpha, gamma)
+        metrics = {"R": R.sum(),
+                   "nA": jnp.bincount(A, length=gameConfig.n_actions),
+                   "sum_of_belief_updates": sum_of_belief_updates}
+        return (Q, S), metrics
+
+    (Q, _), metrics = jax.lax.scan(step, (Q, S), (keys, policy_schedule))
+    return Q, metrics
@@ -1,5 +1,6 @@
 import matplotlib.pyplot as plt
 import numpy as np
+from .running import Metrics
 
 
 def welfare(R, N_AGENTS, welfareType="AVERAGE"):
@@ -13,7 +14,7 @@ def welfare(R, N_AGENTS, welfareType="AVERAGE"):
         raise "SPECIFY WELFARE TYPE"
 
 
-def plot_run(M, NAME, n_agents, n_actions, n_iter):
+def plot_run(M: Metrics, NAME, n_agents, n_actions, n_iter):
     ## PLOTTING EVOLUTION
     print(NAME)
     lines = []  # list for lines which need legend
@@ -24,7 +25,7 @@ def plot_run(M, NAME, n_agents, n_actions, n_iter):
 
     fig, ax = plt.subplots(nrows=3, ncols=2, figsize=(12,12))
 
-    W = [welfare(M[t]["R"], n_agents, "AVERAGE") for t in range(n_iter)]
+    W = M.R[:n_iter].sum(axis=1) / n_agents  # "AVERAGE" welfare
 
     ax[0, 0].plot(W, color=u'#1f77b4')
     ax[0, 0].set_ylim((-2, -1.5))
@@ -34,14 +35,12 @@ def plot_run(M, NAME, n_agents, n_actions, n_iter):
     # ax[0, 0].plot(np.arange(0, n_iter, ))
 
     x_vals = np.arange(0, n_iter)
-    T = {}
-    for a in range(n_actions):
-        T[a] = [M[t]["T"][a] for t in range(n_iter)]
+    T = M.T[:n_iter]
 
     ax[2, 1].set_prop_cycle(color=colors)
 
     for a in range(n_actions):
-        ax[2, 1].scatter(x_vals, T[a], label=a_labels[a], alpha=0.4)
+        ax[2, 1].scatter(x_vals, T[:, a], label=a_labels[a], alpha=0.4)
     # ax[2, 1].set_ylim((-2, -1))
     ax[2, 1].set_xlabel('t')
     ax[2, 1].set_ylabel('travel time')
@@ -49,21 +48,19 @@ def plot_run(M, NAME, n_agents, n_actions, n_iter):
     ax[2, 1].legend()
 
     x_vals = np.arange(0, n_iter)
-    nA = {}
-    for a in range(n_actions):
-        nA[a] = [M[t]["nA"][a] for t in range(n_iter)]
+    nA = M.nA[:n_iter]
 
     ax[2, 0].set_prop_cycle(color=colors)
 
     for a in range(n_actions):
-        ax[2, 0].scatter(x_vals, nA[a], label=a_labels[a], alpha=0.4)
+        ax[2, 0].scatter(x_vals, nA[:, a], label=a_labels[a], alpha=0.4)
     ax[2, 0].set_ylim((0, n_agents))
     ax[2, 0].set_xlabel('t')
     ax[2, 0].set_ylabel('number of actions')
     ax[2, 0].set_title("Action Profile")
     ax[2, 0].legend()
 
-    Qmean = [M[t]["Qmean"] for t in range(n_iter)]
+    Qmean = M.Qmean[:n_iter]
 
     ax[1, 1].set_prop_cycle(color=colors)
 
@@ -74,7 +71,7 @@ def plot_run(M, NAME, n_agents, n_actions, n_iter):
     ax[1, 1].set_title(r"$\hat{Q}(a)$ Averaged over Drivers")
     ax[1, 1].legend()
 
-    alignment = [M[t]["Qvar"] for t in range(n_iter)]
+    alignment = M.Qvar[:n_iter]
     ax[1, 0].set_prop_cycle(color=colors)
     ax[1, 0].plot(alignment, label=a_labels)
     # ax[1, 0].set_xlabel('t')
@@ -3,6 +3,8 @@ import scipy.cluster
 from tqdm.auto import tqdm
 import multiprocessing as mp
 import math
+from numba import njit, prange
+from dataclasses import dataclass
 from .games import GameConfig
 
 
@@ -17,9 +19,55 @@ def welfare(R, N_AGENTS, welfareType="AVERAGE"):
         raise "SPECIFY WELFARE TYPE"
 
 
-def count_groups(q_values, dist):
-    y = scipy.cluster.hierarchy.average(q_values)
-    z = scipy.cluster.hierarchy.fcluster(y, dist, criterion='distance')
+@dataclass
+class Metrics:
+    """
+    The per-iteration metrics of a run, stored as one array per metric which is written as, e.g., M.R[t] = R.
+    """
+    R: np.ndarray  # rewards indexed by (iterations, agents)
+    T: np.ndarray  # payoffs indexed by (iterations, actions)
+    Qmean: np.ndarray  # q-values averaged over agents indexed by (iterations, actions)
+    Qvar: np.ndarray  # variance of q-values over agents indexed by (iterations, actions)
+    nA: np.ndarray  # number of agents taking each action indexed by (iterations, actions)
+
+
+def initialize_metrics(gameConfig: GameConfig):
+    """
+    Preallocates zeroed metrics for gameConfig.n_iter iterations of a run.
+    :param gameConfig: dataclass of parameters for the game
+    :return: Metrics
+    """
+    n_iter = gameConfig.n_iter
+    return Metrics(R=np.zeros((n_iter, gameConfig.n_agents)),
+                   T=np.zeros((n_iter, gameConfig.n_actions)),
+                   Qmean=np.zeros((n_iter, gameConfig.n_actions)),
+                   Qvar=np.zeros((n_iter, gameConfig.n_actions)),
+                   nA=np.zeros((n_iter, gameConfig.n_actions), dtype=np.int64))
+
+
+def count_groups(q_values, dist, method="BUCKET"):
+    """
+    Counts the groups of agents with similar q-values, as the length of the bincount over 1-based group labels, i.e.
+    the number of groups plus one.
+    With the default method "BUCKET" the q-values are rounded to a grid with spacing dist and agents in the same grid
+    cell form a group. This approximation needs O(N log N) time and O(N) memory in the number of agents N, but splits
+    groups which straddle cell boundaries, so that it can count more groups than "AVERAGE".
+    With method "AVERAGE" the groups are the clusters of an average linkage clustering cut at distance dist, which
+    builds the O(N^2) matrix of pairwise distances.
+    :param q_values: np.ndarray of q-values indexed by (agents, actions)
+    :param dist: float distance below which agents are grouped together
+    :param method: "BUCKET" or "AVERAGE"
+    :return: int number of groups plus one
+    """
+    if method == "BUCKET":
+        buckets = np.round(q_values / dist).astype(np.int64)
+        _, z = np.unique(buckets, axis=0, return_inverse=True)
+        z = z.ravel() + 1
+    elif method == "AVERAGE":
+        y = scipy.cluster.hierarchy.average(q_values)
+        z = scipy.cluster.hierarchy.fcluster(y, dist, criterion='distance')
+    else:
+        raise ValueError(f"unknown method {method}, use BUCKET or AVERAGE")
     groups = np.bincount(z)
     return len(groups)
 
@@ -55,3 +103,67 @@ def run_apply_async_multiprocessing(func, argument_list, num_processes=None):
         result_list_tqdm.append(job.get())
 
     return result_list_tqdm
+
+
+def run_replicates(q_tables, S, payoff, payoff_params, alpha, gamma, epsilon_schedule, seeds=None):
+    """
+    Runs independent replicates of stateless epsilon greedy q-learning in parallel threads of a single process, as an
+    alternative to run_apply_async_multiprocessing which avoids starting processes and pickling q-tables.
+    Each replicate plays len(epsilon_schedule) iterations, where states stay fixed.
+    The random draws of each replicate come from numba's generator, which np.random.seed does not seed from Python.
+    Instead, each replicate runs on a single thread which is seeded with its entry of seeds first, so that runs with
+    the same seeds are reproducible.
+    :param q_tables: np.ndarray Q-tables indexed by (replicates, agents, states, actions), updated in place
+    :param S: np.ndarray States indexed by (replicates, agents)
+    :param payoff: numba jitted game called as payoff(A, R, T, payoff_params), which fills the rewards R indexed by
+    agents and the payoffs T indexed by actions in place for the actions A, such as braess_augmented_network_kernel
+    :param payoff_params: tuple of parameters of the game
+    :param alpha: float or np.ndarray learning rates indexed by (agents)
+    :param gamma: float or np.ndarray discount factors indexed by (agents)
+    :param epsilon_schedule: np.ndarray exploration rates indexed by (iterations), e.g. from exploration_schedule
+    :param seeds: np.ndarray of integer seeds in [0, 2**32) indexed by (replicates), freshly drawn if None
+    :return: np.ndarray Q-tables, np.ndarray average rewards indexed by (replicates, iterations), and np.ndarray
+    action counts indexed by (replicates, iterations, actions)
+    """
+    n_replicates, n_agents, n_states, n_actions = q_tables.shape
+    n_iter = len(epsilon_schedule)
+    alpha = np.broadcast_to(np.asarray(alpha, dtype=np.float64), n_agents)
+    gamma = np.broadcast_to(np.asarray(gamma, dtype=np.float64), n_agents)
+    W = np.zeros((n_replicates, n_iter))
+    nA = np.zeros((n_replicates, n_iter, n_actions), dtype=np.int64)
+    if seeds is None:
+        seeds = np.random.default_rng().integers(2 ** 32, size=n_replicates)
+    _run_replicates_kernel(q_tables, S, payoff, payoff_params, alpha, gamma,
+                           np.asarray(epsilon_schedule, dtype=np.float64), np.asarray(seeds, dtype=np.uint32), W, nA)
+    return q_tables, W, nA
+
+
+@njit(parallel=True)
+def _run_replicates_kernel(q_tables, S, payoff, payoff_params, alpha, gamma, epsilon_schedule, seeds, W, nA):
+    n_replicates, n_agents, _, n_actions = q_tables.shape
+    for r in prange(n_replicates):
+        np.random.seed(seeds[r])
+        Q = q_tables[r]
+        A = np.empty(n_agents, dtype=np.int64)
+        R = np.empty(n_agents)
+        T = np.empty(n_actions)
+        for t in range(epsilon_schedule.shape[0]):
+            for i in range(n_agents):
+                if np.random.random() < epsilon_schedule[t]:
+                    A[i] = np.random.randint(0, n_actions)
+                else:
+                    best = 0
+                    for a in range(1, n_actions):
+                        if Q[i, S[r, i], a] > Q[i, S[r, i], best]:
+                            best = a
+                    A[i] = best
+            payoff(A, R, T, payoff_params)
+            for i in range(n_agents):
+                next_max = Q[i, S[r, i], 0]
+                for a in range(1, n_actions):
+                    if Q[i, S[r, i], a] > next_max:
+                        next_max = Q[i, S[r, i], a]
+                Q[i, S[r, i], A[i]] += alpha[i] * (R[i] + gamma[i] * next_max - Q[i, S[r, i], A[i]])
+                W[r, t] += R[i]
+                nA[r, t, A[i]] += 1
+            W[r, t] /= n_agents